@@ -5,4 +5,7 @@ set -e
 python /app/preload_memcache.py || echo "⚠️  Memcached preload failed (continuing)"
 
 # Start the API
-exec uvicorn main:app --host 0.0.0.0 --port 8000
\ No newline at end of file
+# uvloop (event loop) and httptools (HTTP parser) are C-accelerated replacements
+# for the pure-Python defaults; one worker process per CPU unless WEB_CONCURRENCY is set
+exec uvicorn main:app --host 0.0.0.0 --port 8000 \
+    --loop uvloop --http httptools --workers "${WEB_CONCURRENCY:-$(nproc)}"
\ No newline at end of file
@@ -12,31 +12,133 @@ This application demonstrates:
 For educational purposes only - not production-ready!
 """
 
-from fastapi import FastAPI, HTTPException, Depends
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from pydantic import BaseModel
-from datetime import datetime, timedelta, timezone
+from fastapi import FastAPI, HTTPException, Depends, Request, Response
+from fastapi.responses import ORJSONResponse
+from fastapi.security import HTTPBearer
+from pydantic import BaseModel, Field
+from datetime import timedelta
+from contextlib import asynccontextmanager, suppress
+from typing import Annotated, Callable
+import asyncio
+import hashlib
+import logging
+import os
+import time
 import jwt
-import memcache
-from passlib.context import CryptContext
+from jwt.utils import base64url_encode
+from cachetools import TTLCache
+import orjson
+from pymemcache.client.base import PooledClient
+from pymemcache.exceptions import MemcacheError, MemcacheIllegalInputError
+import bcrypt
+
+# --- Logging ---
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
 # --- App Initialization ---
-app = FastAPI()
-# HTTPBearer extracts the token from the "Authorization: Bearer <token>" header
-bearer = HTTPBearer()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Loads all users from Memcached at startup and keeps the snapshot fresh.
+
+    See load_users() below - after startup, logins and token checks for known
+    users are served from process memory without touching the network.
+    """
+    await asyncio.to_thread(load_users)
+    refresher = asyncio.create_task(refresh_users_forever())
+    yield
+    refresher.cancel()
+    with suppress(asyncio.CancelledError):
+        await refresher
+
+# ORJSONResponse is the default for any route that returns a plain value. The
+# current routes all build their Response bytes themselves, so it only takes
+# effect for routes added later. HTTPException and validation (422) error
+# bodies do not use it: they still go through FastAPI's own JSONResponse.
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
+
+class BearerToken(HTTPBearer):
+    """
+    Extracts the token from the "Authorization: Bearer <token>" header.
+
+    Lighter than the stock HTTPBearer: it returns the raw token string instead of
+    building an HTTPAuthorizationCredentials model on every request. Subclassing
+    HTTPBearer keeps the "Authorize" button in the interactive /docs page.
+    """
+
+    async def __call__(self, request: Request) -> str:
+        scheme, _, token = request.headers.get("authorization", "").partition(" ")
+        if scheme.lower() != "bearer" or not token:
+            raise HTTPException(
+                status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"}
+            )
+        return token
+
+# Keep the stock scheme name so the published OpenAPI spec is unchanged
+bearer = BearerToken(scheme_name="HTTPBearer")
 
 # --- Security Settings ---
 # WARNING: In production, never hardcode secrets! Use environment variables.
 SECRET_KEY = "your-secret-key"  # Used to sign and verify JWT tokens
 ALGORITHM = "HS256"  # HMAC with SHA-256 algorithm for signing tokens
+# The secret wrapped once as a ready-to-use HS256 key, so PyJWT doesn't have to look up
+# the algorithm and re-prepare the raw secret string on every decode (encoding
+# still does both internally, so token creation is no faster)
+_SIGNING_KEY = jwt.PyJWK(
+    {"kty": "oct", "k": base64url_encode(SECRET_KEY.encode()).decode()}, algorithm=ALGORITHM
+)
 ACCESS_TOKEN_EXPIRE_MINUTES = 2  # Intentionally short to demonstrate expiration
-# CryptContext handles password hashing - bcrypt is slow on purpose to prevent brute force attacks
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Passwords are hashed with bcrypt - it is slow on purpose to prevent brute force attacks
+# Cost factor (work = 2**rounds) - keep in sync with preload_memcache.py
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# A throwaway hash checked when the username is unknown, so failed logins take the
+# same time whether or not the user exists (prevents username enumeration by timing)
+_DUMMY_HASH = bcrypt.hashpw(b"dummy-password", bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode()
 
 # --- Connect to Memcached ---
 # Memcached stores user data (simulates a database for this demo)
 # 'memcached:11211' is the Docker service name and port
-mc = memcache.Client(['memcached:11211'], debug=0)
+# PooledClient is thread-safe: each concurrent caller borrows its own connection
+# from the pool instead of interleaving requests on one shared socket.
+# Values are raw JSON bytes (see preload_memcache.py), so no serde is needed.
+# Lookups run on the event loop, so every socket operation gets a timeout:
+# an unresponsive Memcached must not freeze the whole worker.
+MEMCACHED_TIMEOUT = 3  # seconds, same as python-memcached's default
+mc = PooledClient(
+    ('memcached', 11211), max_pool_size=16, connect_timeout=MEMCACHED_TIMEOUT, timeout=MEMCACHED_TIMEOUT
+)
+
+# --- In-Process User Snapshot ---
+# The demo's user set is tiny, so every user listed in "users:index" is copied
+# into this dict at startup and re-read periodically. Memcached stays the shared
+# source of truth (e.g. for changes made by other workers); get_user only falls
+# back to it for users that aren't in the snapshot yet.
+USERS_REFRESH_SECONDS = 30
+_users: dict[str, dict] = {}
+
+# --- Token Cache ---
+# Verifying a JWT signature on every request is wasted work when a client reuses
+# the same token for its whole lifetime. Successfully decoded payloads are cached
+# by the raw token string; each entry also stores the token's "exp" so a cached
+# token still stops working the moment it expires.
+_token_cache: TTLCache = TTLCache(maxsize=10_000, ttl=300)
+
+# --- User Cache ---
+# Keeps recently used user records in process memory so hot users don't cost a
+# Memcached round-trip on every request. The short TTL bounds how stale a
+# record can get after it changes in Memcached.
+_user_cache: TTLCache = TTLCache(maxsize=1024, ttl=30)
+# Usernames Memcached recently reported as missing, so repeated attempts with
+# unknown names (e.g. credential-stuffing bots) don't reach Memcached at all
+_missing_user_cache: TTLCache = TTLCache(maxsize=100_000, ttl=60)
+
+# --- Response Cache ---
+# The protected routes' bodies depend only on the route and the user's full_name,
+# so each one is serialized once and reused together with its ETag. full_name is
+# part of the key, so a renamed user gets a fresh body as soon as get_user returns
+# the new record - this cache adds no staleness of its own.
+_response_cache: TTLCache = TTLCache(maxsize=1024, ttl=30)
 
 
 # --- Pydantic Schemas ---
@@ -49,7 +151,8 @@ class Token(BaseModel):
 
 class LoginRequest(BaseModel):
     """Request model for login - user provides username and password"""
-    username: str
+    # Length-capped so unknown names remembered by _missing_user_cache stay small
+    username: str = Field(max_length=64)
     password: str
 
 # --- Helper Functions ---
@@ -67,10 +170,12 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None) -> s
     """
     to_encode = data.copy()  # Don't modify the original dict
     # Calculate when the token expires (current time + expiration duration)
-    expire = datetime.now(timezone.utc) + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+    # as a Unix timestamp, which is the form "exp" takes inside the token anyway
+    lifetime = expires_delta.total_seconds() if expires_delta else ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    expire = int(time.time() + lifetime)
     to_encode.update({"exp": expire})  # Add expiration to the token payload
     # Sign the token with our secret key - only we can create valid tokens
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    return jwt.encode(to_encode, _SIGNING_KEY, algorithm=ALGORITHM)
 
 def verify_password(plain: str, hashed: str) -> bool:
     """
@@ -83,23 +188,96 @@ def verify_password(plain: str, hashed: str) -> bool:
     Returns:
         True if passwords match, False otherwise
     """
-    return pwd_context.verify(plain, hashed)
+    try:
+        return bcrypt.checkpw(plain.encode(), hashed.encode())
+    except ValueError:
+        # The stored value is not a valid bcrypt hash (e.g. missing or empty)
+        return False
+
+def load_users() -> None:
+    """
+    Replaces the in-process user snapshot with every user listed in Memcached.
+
+    All records are fetched in a single get_many round-trip. If Memcached can't
+    be reached or the index is unreadable, the previous snapshot is kept and
+    get_user falls back as usual. Records that can't be decoded are skipped.
+    """
+    global _users
+    try:
+        index = mc.get("users:index")
+        usernames = orjson.loads(index) if index else []
+        records = mc.get_many([f"user:{username}" for username in usernames])
+    except Exception:
+        logger.warning("Could not load users from Memcached, keeping previous snapshot", exc_info=True)
+        return
+    users = {}
+    for username in usernames:
+        raw = records.get(f"user:{username}")
+        if not raw:
+            continue
+        try:
+            users[username] = orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            logger.warning("Skipping undecodable Memcached record for %s", username)
+    # Swap in a whole new dict so concurrent readers never see a half-built one
+    _users = users
+    logger.info("Loaded %d users from Memcached", len(_users))
+
+async def refresh_users_forever() -> None:
+    """Reloads the user snapshot every USERS_REFRESH_SECONDS until cancelled."""
+    while True:
+        await asyncio.sleep(USERS_REFRESH_SECONDS)
+        try:
+            await asyncio.to_thread(load_users)
+        except Exception:
+            # Keep refreshing - one failed round must not end the task for good
+            logger.exception("User snapshot refresh failed")
 
 def get_user(username: str) -> dict | None:
     """
-    Retrieves user data from Memcached.
+    Retrieves user data from the in-process snapshot or local cache if possible,
+    otherwise from Memcached.
 
     Args:
         username: The username to look up
 
     Returns:
         User dict if found, None if not found
+
+    Raises:
+        HTTPException: 503 if Memcached can't be reached
     """
-    user = mc.get(f"user:{username}")  # Memcached key format: "user:alice"
-    print(f"{user=}")  # Debug output to see what was retrieved
+    user = _users.get(username) or _user_cache.get(username)
+    if user is not None:
+        return user
+    if username in _missing_user_cache:
+        return None
+    try:
+        raw = mc.get(f"user:{username}")  # Memcached key format: "user:alice"
+    except MemcacheIllegalInputError:
+        # The name (e.g. with spaces or non-ASCII characters) can't form a valid
+        # Memcached key, so no such user can exist - rejected before any I/O
+        return None
+    except (MemcacheError, OSError):
+        # Not cached as a miss - the user may well exist once Memcached is back
+        logger.warning("Memcached lookup failed for %s", username, exc_info=True)
+        raise HTTPException(status_code=503, detail="User store unavailable")
+    try:
+        user = orjson.loads(raw) if raw else None  # Records are stored as JSON bytes
+    except orjson.JSONDecodeError:
+        # e.g. a leftover pickled record - treated as missing (and cached as such,
+        # so this is logged at most once per cache TTL instead of on every request)
+        logger.warning("Undecodable Memcached record for %s, treating user as missing", username)
+        user = None
+    # Log only the username - the user record contains the password hash
+    logger.debug("user lookup %s (found=%s)", username, user is not None)
+    if user is not None:
+        _user_cache[username] = user
+    else:
+        _missing_user_cache[username] = True
     return user
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(bearer)) -> dict:
+async def get_current_user(token: str = Depends(bearer)) -> dict:
     """
     Dependency function that validates JWT tokens and returns the current user.
 
@@ -107,18 +285,26 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(b
     It automatically extracts and validates the token from the Authorization header.
 
     Args:
-        credentials: Automatically extracted by HTTPBearer from "Authorization: Bearer <token>" header
+        token: Automatically extracted by BearerToken from "Authorization: Bearer <token>" header
 
     Returns:
         User dict if token is valid
 
     Raises:
-        HTTPException: 401 if token is invalid, expired, or user not found
+        HTTPException: 401 if token is missing, invalid, or expired
+        HTTPException: 404 if the token's user no longer exists
+        HTTPException: 503 if the user store (Memcached) can't be reached
     """
-    token = credentials.credentials  # Extract the actual token string
     try:
-        # Decode and verify the token signature
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        # Fast path: this exact token was already verified and hasn't expired yet
+        cached = _token_cache.get(token)
+        if cached and cached[0] > time.time():
+            payload = cached[1]
+        else:
+            # Decode and verify the token signature
+            payload = jwt.decode(token, _SIGNING_KEY, algorithms=[ALGORITHM])
+            # Only tokens that passed verification are cached (errors raise above)
+            _token_cache[token] = (payload.get("exp", 0), payload)
         # Extract username from the "sub" (subject) claim
         username = payload.get("sub")
         if not username:
@@ -135,9 +321,70 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(b
         # Token signature is invalid or token is malformed
         raise HTTPException(status_code=401, detail="Invalid token")
 
+# Reusable annotated type for route parameters that need the logged-in user.
+# FastAPI resolves get_current_user once per request and shares the result with
+# every parameter or sub-dependency that asks for it (use_cache=True).
+CurrentUser = Annotated[dict, Depends(get_current_user, use_cache=True)]
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    Checks an If-None-Match header against an ETag using weak comparison.
+
+    If-None-Match always compares weakly (RFC 9110 section 13.1.2), so a client
+    sending back the tag without its W/ prefix still matches.
+
+    Args:
+        if_none_match: The raw header value - "*" or a comma-separated list of tags
+        etag: The current ETag of the resource
+
+    Returns:
+        True if the client's copy is still current
+    """
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+def cached_json_response(request: Request, user: dict, build: Callable[[], dict]) -> Response:
+    """
+    Returns a per-user JSON response with an ETag, or 304 if the client already has it.
+
+    The serialized body is cached per (route, username, full_name), so repeat
+    requests skip JSON encoding, and clients that send back the ETag in
+    If-None-Match get an empty 304 Not Modified instead of the full body.
+    build() may only use the user fields that are part of that key.
+
+    Args:
+        request: The incoming request (used for its path and If-None-Match header)
+        user: The authenticated user the response is for
+        build: Called on a cache miss to produce the response content
+
+    Returns:
+        A 200 response with the JSON body, or an empty 304 response
+    """
+    key = (request.url.path, user["username"], user.get("full_name"))
+    cached = _response_cache.get(key)
+    if cached is None:
+        body = orjson.dumps(build())
+        # Weak ETag derived from the body, so it changes whenever the content does
+        etag = f'W/"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+        cached = _response_cache[key] = (body, etag)
+    body, etag = cached
+    # The response is per-user: browsers may keep it, but must revalidate each time
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
 # --- Routes ---
 
-@app.post("/token", response_model=Token)
+# Constant end of every /token response body, encoded once
+_TOKEN_RESPONSE_TAIL = b'","token_type":"bearer"}'
+
+# The Token model is only used to document the response: the route builds the
+# JSON body itself, so FastAPI doesn't need to validate it through Pydantic
+@app.post("/token", responses={200: {"model": Token}})
 async def login(form: LoginRequest):
     """
     Login endpoint - exchanges username/password for a JWT token.
@@ -154,17 +401,27 @@ async def login(form: LoginRequest):
         HTTPException: 401 if credentials are incorrect
     """
     user = get_user(form.username)
+    # Always run exactly one bcrypt check - against the dummy hash if the user
+    # doesn't exist or has no stored hash - so response time doesn't reveal which
+    hashed = user.get("hashed_password") if user else None
+    # bcrypt is deliberately slow, so it runs in a worker thread to keep the
+    # event loop free to serve other requests in the meantime
+    password_ok = await asyncio.to_thread(verify_password, form.password, hashed or _DUMMY_HASH)
     # Check if user exists AND password is correct
-    # Use .get() with default "" to avoid KeyError if hashed_password is missing
-    if not user or not verify_password(form.password, user.get("hashed_password", "")):
+    if not hashed or not password_ok:
         # Don't reveal whether username or password was wrong (security best practice)
         raise HTTPException(status_code=401, detail="Incorrect username or password")
     # Create a JWT token with username as the "sub" (subject) claim
     access_token = create_access_token({"sub": user["username"]})
-    return {"access_token": access_token, "token_type": "bearer"}
+    # A JWT only contains URL-safe base64 characters and dots, so it can be
+    # spliced into the JSON without escaping - no JSON encoder needed at all
+    return Response(
+        content=b'{"access_token":"' + access_token.encode() + _TOKEN_RESPONSE_TAIL,
+        media_type="application/json",
+    )
 
 @app.get("/protected")
-async def protected_route(user: dict = Depends(get_current_user)):
+async def protected_route(request: Request, user: CurrentUser):
     """
     A protected route that requires a valid JWT token.
 
@@ -173,11 +430,16 @@ async def protected_route(user: dict = Depends(get_current_user)):
 
     Try this in your terminal:
         curl -H "Authorization: Bearer <your_token>" http://localhost:8000/protected
+
+    Repeat the request with -H 'If-None-Match: <ETag from the first response>'
+    to get a 304 Not Modified with no body.
     """
-    return {"message": f"Hello, {user['full_name']}! This is a protected endpoint."}
+    return cached_json_response(
+        request, user, lambda: {"message": f"Hello, {user['full_name']}! This is a protected endpoint."}
+    )
 
 @app.get("/protected2")
-async def protected_admin_route(user: dict = Depends(get_current_user)):
+async def protected_admin_route(request: Request, user: CurrentUser):
     """
     An admin-only route that requires BOTH authentication AND authorization.
 
@@ -192,7 +454,9 @@ async def protected_admin_route(user: dict = Depends(get_current_user)):
     if not user.get("admin"):
         # 403 Forbidden = authenticated but not authorized
         raise HTTPException(status_code=403, detail="Admin access required")
-    return {"message": f"Welcome Admin {user['full_name']}! You have access to this route."}
+    return cached_json_response(
+        request, user, lambda: {"message": f"Welcome Admin {user['full_name']}! You have access to this route."}
+    )
 
 # --- Run standalone ---
 if __name__ == "__main__":